@@ -0,0 +1,52 @@
+import httpx
+import orjson
+import os
+import time
+
+API_URL = os.getenv("API_URL", "http://localhost:8081")  
+
+class RetryTransport(httpx.HTTPTransport):
+    # Retries idempotent reads that hit a transient gateway error, with exponential backoff
+    RETRY_METHODS = ('GET', 'HEAD')
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, total=2, backoff_factor=0.1, **kwargs):
+        super().__init__(**kwargs)
+        self.total = total
+        self.backoff_factor = backoff_factor
+
+    def handle_request(self, request):
+        response = super().handle_request(request)
+        if request.method not in self.RETRY_METHODS:
+            return response
+
+        for attempt in range(self.total):
+            if response.status_code not in self.RETRY_STATUSES:
+                break
+            response.close()
+            time.sleep(self.backoff_factor * (2 ** attempt))
+            response = super().handle_request(request)
+        return response
+
+# Shared HTTP/2 client so concurrent calls to the API are multiplexed over pooled connections.
+# h2 is only negotiated over TLS, so API_URL must point at an h2-capable frontend to benefit.
+CLIENT = httpx.Client(
+    base_url=API_URL,
+    headers={'User-Agent': 'library-bff'},
+    # Bounded connect/read timeouts keep a hung API from pinning a worker
+    timeout=httpx.Timeout(5.0, connect=1.0),
+    transport=RetryTransport(
+        total=2,
+        backoff_factor=0.1,
+        http2=True,
+        retries=2,  # connection failures, any method
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    ),
+)
+
+# Not a client default: multipart uploads need httpx to set their own Content-Type
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+def parse_json(r):
+    # orjson decodes the raw bytes directly, skipping httpx's text decoding and stdlib json
+    return orjson.loads(r.content)
@@ -1,25 +1,60 @@
-from functools import wraps
-from flask import Flask, request, redirect, url_for, make_response, jsonify, render_template
-import requests
+from functools import wraps, lru_cache
+from flask import g, request, redirect, url_for, make_response, jsonify, render_template
+import httpx
+import orjson
 import datetime
-import os
+from api_client import CLIENT, JSON_HEADERS, parse_json
 
-API_URL = os.getenv("API_URL", "http://localhost:8081")  
-
-app = Flask(__name__)
+def load_user():
+    # Read the auth cookie once per request; views use g.user_id afterwards
+    g.user_id = request.cookies.get('authenticatedUserID')
 
 def is_authenticated():
-    user_id = request.cookies.get('authenticatedUserID')
-    return user_id is not None
+    if 'user_id' not in g:
+        load_user()
+    return g.user_id is not None
+
+@lru_cache(maxsize=None)
+def _login_url():
+    # The login route lives on the BFF app, so resolve it on first use inside a request
+    return url_for('login_route')
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not is_authenticated():
-            return redirect(url_for('login_route'))
+            return redirect(_login_url())
         return f(*args, **kwargs)
     return decorated_function
 
+def _api_error(r, response_json):
+    return make_response(jsonify({"error": response_json.get("message")}), 500)
+
+def _unexpected(r, response_json):
+    return make_response(jsonify({"error": "An unexpected error occurred"}), r.status_code)
+
+def _signup_ok(r, response_json):
+    return redirect(_login_url())
+
+def _render_signup_error(r, response_json):
+    return render_template('sign_up.html', error=response_json.get("message"))
+
+def _login_ok(r, response_json):
+    id = response_json.get("existingUserID")
+    expire_date = datetime.datetime.now() + datetime.timedelta(days=1)
+
+    resp = make_response(redirect("/"))  
+    resp.set_cookie("authenticatedUserID", value=str(id), expires=expire_date) 
+
+    return resp
+
+def _render_login_error(r, response_json):
+    return render_template('login.html', error=response_json.get("message"))
+
+# API status code -> response builder
+_SIGNUP_HANDLERS = {201: _signup_ok, 400: _render_signup_error, 409: _render_signup_error, 500: _api_error}
+_LOGIN_HANDLERS = {200: _login_ok, 400: _render_login_error, 404: _render_login_error, 500: _api_error}
+
 def signup():
     if request.method == "GET":
         return render_template('sign_up.html')
@@ -31,28 +66,13 @@ def signup():
                 'password': request.form.get('password')
             }
 
-            # Log the data to verify it before sending
-            print(f"Sending data to API: {data}")
-
             # Send the request with JSON data
-            r = requests.post(
-                f'{API_URL}/signup',
-                json=data,  
-                headers={'Content-Type': 'application/json'}
-            )
-
-            response_json = r.json()
-
-            if r.status_code == 201:
-                return redirect(url_for("login_route"))
-            elif r.status_code in (400, 409):
-                error_message = response_json.get("message")
-                return render_template('sign_up.html', error=error_message)
-            elif r.status_code == 500:
-                return make_response(jsonify({"error": response_json.get("message")}), 500)
-            else:
-                return make_response(jsonify({"error": "An unexpected error occurred"}), r.status_code)
-        except requests.RequestException as e:
+            r = CLIENT.post('/signup', content=orjson.dumps(data), headers=JSON_HEADERS)
+
+            response_json = parse_json(r)
+
+            return _SIGNUP_HANDLERS.get(r.status_code, _unexpected)(r, response_json)
+        except httpx.HTTPError as e:
             return make_response(jsonify({"error": "Failed to connect to the external API", "details": str(e)}), 500)
 
 def login():
@@ -66,39 +86,14 @@ def login():
                 'password': request.form.get('password')
             }
 
-            # Log the data to verify it before sending
-            print(f"Sending data to API: {data}")
-
             # Send the request with JSON data
-            r = requests.post(
-                f'{API_URL}/login',
-                json=data,  
-                headers={'Content-Type': 'application/json'}
-            )
-            response_json = r.json()
-
-            if r.status_code == 200:
-                id = response_json.get("existingUserID")
-                expire_date = datetime.datetime.now() + datetime.timedelta(days=1)
-
-                resp = make_response(redirect("/"))  
-                resp.set_cookie("authenticatedUserID", value=str(id), expires=expire_date) 
-
-                return resp
-            elif r.status_code == 400:
-                error_message = response_json.get("message")
-                return render_template('login.html', error=error_message)
-            elif r.status_code == 404:
-                error_message = response_json.get("message")
-                return render_template('login.html', error=error_message)
-            elif r.status_code == 500:
-                return make_response(jsonify({"error": response_json.get("message")}), 500)
-            else:
-                return make_response(jsonify({"error": "An unexpected error occurred"}), r.status_code)
-        except requests.RequestException as e:
+            r = CLIENT.post('/login', content=orjson.dumps(data), headers=JSON_HEADERS)
+            response_json = parse_json(r)
+
+            return _LOGIN_HANDLERS.get(r.status_code, _unexpected)(r, response_json)
+        except httpx.HTTPError as e:
             return make_response(jsonify({"error": "Failed to connect to the external API", "details": str(e)}), 500)
 
-@app.route('/logout')
 def logout():
     resp = make_response(redirect("/"))
     resp.set_cookie('authenticatedUserID', '', expires=0)
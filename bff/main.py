@@ -1,22 +1,137 @@
-from flask import Flask, render_template, jsonify, request, url_for, send_from_directory, redirect, json, make_response
-import requests
+from flask import Flask, render_template, jsonify, request, url_for, redirect
+from flask.logging import default_handler
+from flask.json.provider import JSONProvider
+import httpx
+import orjson
 import os
-from functools import wraps
+import atexit
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
-from auth import login_required, signup, login, logout
+from flask_caching import Cache
+from api_client import CLIENT, JSON_HEADERS, parse_json
+from auth import login_required, load_user, signup, login, logout
 
 
-ALLOWED_EXTENSIONS = set(['txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'])
+ALLOWED_EXTENSIONS = frozenset({'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'})
 
-app = Flask(__name__)
+def _allowed(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+class OrjsonProvider(JSONProvider):
+    # Routes jsonify and request.get_json through orjson instead of stdlib json
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
 
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+DEBUG = os.getenv('FLASK_DEBUG', '0') == '1'
+
+# Records are written by a listener thread so request threads never block on stderr
+_log_queue = queue.SimpleQueue()
+app.logger.removeHandler(default_handler)
+app.logger.addHandler(QueueHandler(_log_queue))
+app.logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+_log_listener = QueueListener(_log_queue, default_handler)
+_log_listener.start()
+# stop() drains whatever is still queued, so records logged just before exit aren't lost
+atexit.register(_log_listener.stop)
+
+# Outside debug mode templates are compiled once and never re-stat'ed
+app.config['TEMPLATES_AUTO_RELOAD'] = DEBUG
+app.jinja_env.auto_reload = DEBUG
+for template_name in ('books.html', 'authors.html'):
+    app.jinja_env.get_template(template_name)
+
+app.before_request(load_user)
+
+# SimpleCache is per process; gunicorn's workers need a shared backend such as RedisCache
+CACHE_TYPE = os.getenv("CACHE_TYPE", "SimpleCache")
+cache = Cache(app, config={
+    "CACHE_TYPE": CACHE_TYPE,
+    "CACHE_REDIS_URL": os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+    "CACHE_DEFAULT_TIMEOUT": 60,
+})
+# Only a shared cache sees every worker's invalidations, so only then can it answer for the API
+CACHE_SHARED = CACHE_TYPE != "SimpleCache"
 
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
+UPLOAD_DIR = app.config['UPLOAD_FOLDER']
 
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+# Static assets are served from /static/ and cached by browsers for 30 days;
+# behind a proxy that honours X-Sendfile, Flask only sends the header
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 2592000
+app.use_x_sendfile = os.getenv('USE_X_SENDFILE', '0') == '1'
 
-API_URL = os.getenv("API_URL", "http://localhost:8081")  
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Runs independent API calls side by side inside a single view
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Last ETag and parsed body seen per listing URL
+_ETAGS = {}
+
+def _conditional_get(url):
+    # Revalidate with If-None-Match so an unchanged listing comes back as a bodyless 304
+    cached = _ETAGS.get(url)
+    headers = {'If-None-Match': cached[0]} if cached else None
+    response = CLIENT.get(url, headers=headers)
+    if response.status_code == 304 and cached:
+        return response, cached[1]
+    if response.status_code != 200:
+        return response, None
+
+    body = parse_json(response) or []
+    etag = response.headers.get('ETag')
+    if etag:
+        _ETAGS[url] = (etag, body)
+    return response, body
+
+# The ID indexes share the listings' TTL, so a hit means the listing is still fresh
+@cache.memoize(timeout=60)
+def _fetch_books():
+    _, books = _conditional_get("/books")
+    if books is not None:
+        cache.set("book_ids", frozenset(book['book_id'] for book in books), timeout=60)
+    return books
+
+@cache.memoize(timeout=60)
+def _fetch_authors():
+    _, authors = _conditional_get("/authors")
+    if authors is not None:
+        cache.set("author_ids", frozenset(author['id'] for author in authors), timeout=60)
+    return authors
+
+def _search_cache_key():
+    # Bumping search_version orphans every cached search at once; old entries just expire
+    return f"search:{cache.get('search_version') or 0}:{request.full_path}"
+
+def _invalidate_searches():
+    cache.set("search_version", os.urandom(8).hex(), timeout=0)
+
+def _invalidate_books():
+    cache.delete_memoized(_fetch_books)
+    cache.delete("book_ids")
+    _invalidate_searches()
+
+def _invalidate_authors():
+    # Book listings embed author names, so they go stale together
+    cache.delete_memoized(_fetch_authors)
+    cache.delete("author_ids")
+    _invalidate_books()
+
+def _is_ok(rv):
+    # Views return (body, status) tuples on errors; only plain 200 renders are cacheable
+    if isinstance(rv, tuple):
+        return len(rv) < 2 or rv[1] == 200
+    return getattr(rv, 'status_code', 200) == 200
 
 def validate_body_length(max_length, field_limits=None):
     if field_limits is None:
@@ -25,15 +140,22 @@ def validate_body_length(max_length, field_limits=None):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            if request.method in ['POST', 'PUT']:
-                data = request.form.to_dict()
-                total_length = 0
-
-                for key, value in data.items():
-                    if key in field_limits:
-                        if len(value) > field_limits[key]:
-                            return jsonify(success=False, error=f"{key.capitalize()} field too long, should not exceed {field_limits[key]} characters."), 400
-                    total_length += len(value)
+            if request.method not in ('POST', 'PUT'):
+                return func(*args, **kwargs)
+
+            # A body of at most max_length bytes can't hold more than max_length characters
+            content_length = request.content_length
+            body_fits = content_length is not None and content_length <= max_length
+            if body_fits and not field_limits:
+                return func(*args, **kwargs)
+
+            for key, limit in field_limits.items():
+                value = request.form.get(key)
+                if value is not None and len(value) > limit:
+                    return jsonify(success=False, error=f"{key.capitalize()} field too long, should not exceed {limit} characters."), 400
+
+            if not body_fits:
+                total_length = sum(len(value) for _, value in request.form.items())
                 if total_length > max_length:
                     return jsonify(success=False, error=f"Request body too long, should not exceed {max_length} characters."), 400
 
@@ -45,35 +167,27 @@ def validate_body_length(max_length, field_limits=None):
 @login_required
 def index():
     try:
-        response = requests.get(f"{API_URL}/books")
-        if response.status_code != 200:
+        books = _fetch_books()
+        if books is None:
             return "Error fetching books from API", 400
-        books = response.json()
         return render_template('books.html', books=books)
     except Exception as err:
         return str(err), 500
 
-@app.route('/register', methods=['POST', 'GET'])
-def register():
-    return signup()
-
-@app.route('/login', methods=['POST', 'GET'])
-def login_route():
-    return login()
-
-@app.route('/logout', methods=['GET'])
-def logout_route():
-    return logout()
+app.add_url_rule('/register', 'register', signup, methods=['POST', 'GET'])
+app.add_url_rule('/login', 'login_route', login, methods=['POST', 'GET'])
+app.add_url_rule('/logout', 'logout_route', logout, methods=['GET'])
 
 @app.route('/search_books', methods=['GET'])
+@cache.cached(timeout=30, key_prefix=_search_cache_key, response_filter=_is_ok)
 def search_books():
     query = request.args.get('query', '')
-    response = requests.get(f'{API_URL}/search_books', params={'query': query})
+    response = CLIENT.get('/search_books', params={'query': query})
     
     if response.status_code != 200:
         return f"Error: {response.text}", response.status_code
     
-    books = response.json()
+    books = parse_json(response)
     
     if books is None or not books:
         books = []
@@ -84,13 +198,14 @@ def search_books():
     return render_template('books.html', books=books, message=message)
 
 @app.route('/search_authors', methods=['GET'])
+@cache.cached(timeout=30, key_prefix=_search_cache_key, response_filter=_is_ok)
 def search_authors():
     query = request.args.get('query', '')
-    response = requests.get(f'{API_URL}/search_authors', params={'query': query})
+    response = CLIENT.get('/search_authors', params={'query': query})
     
     if response.status_code != 200:
         return f"Error: {response.text}", response.status_code
-    authors = response.json()
+    authors = parse_json(response)
     
     if authors is None or not authors:
         authors = []
@@ -103,12 +218,12 @@ def search_authors():
 @app.route('/book-details/<int:book_id>')
 def book_details(book_id):
     try:
-        response = requests.get(f"{API_URL}/books/{book_id}")
+        response = CLIENT.get(f"/books/{book_id}")
         response.raise_for_status() 
-        book = response.json()
-        app.logger.debug(f"Book details: {book}")
+        book = parse_json(response)
+        app.logger.debug("Book details: %s", book)
         return render_template('book_details.html', book=book)
-    except requests.RequestException as err:
+    except httpx.HTTPError as err:
         app.logger.error(f"Error fetching book details: {err}")
         return f"Error fetching book details: {err}", 500
     
@@ -116,12 +231,11 @@ def book_details(book_id):
 @login_required
 def get_subscribers():
     try:
-        response = requests.get(f"{API_URL}/subscribers")
-        if response.status_code == 200:
-            subscribers = response.json()
+        response, subscribers = _conditional_get("/subscribers")
+        if subscribers is not None:
             return render_template('subscribers.html', subscribers=subscribers)
         else:
-            error_message = response.json().get('error', 'Failed to retrieve subscribers')
+            error_message = parse_json(response).get('error', 'Failed to retrieve subscribers')
             app.logger.error(f"Failed to retrieve subscribers: {error_message}")
             return jsonify(success=False, error=error_message), 500
     except Exception as err:
@@ -132,11 +246,10 @@ def get_subscribers():
 @login_required
 def get_authors():
     try:
-        response = requests.get(f"{API_URL}/authors")
-        if response.status_code != 200:
+        authors = _fetch_authors()
+        if authors is None:
             return "Error fetching authors from API", 400
-        
-        authors = response.json()
+
         return render_template('authors.html', authors=authors)
     
     except Exception as err:
@@ -145,10 +258,15 @@ def get_authors():
 @app.route('/author/<int:author_id>', methods=['DELETE'])
 @login_required
 def delete_author(author_id):
+    known_ids = cache.get("author_ids") if CACHE_SHARED else None
+    if known_ids is not None and author_id not in known_ids:
+        return jsonify(success=False), 404
+
     try:
-        response = requests.delete(f"{API_URL}/authors/{author_id}")
+        response = CLIENT.delete(f"/authors/{author_id}")
         if response.status_code != 200:
             return jsonify(success=False), 400
+        _invalidate_authors()
         return jsonify(success=True)
     except Exception as err:
         return jsonify(success=False, error=str(err)), 500
@@ -156,10 +274,15 @@ def delete_author(author_id):
 @app.route('/book/<int:book_id>', methods=['DELETE'])
 @login_required
 def delete_book(book_id):
+    known_ids = cache.get("book_ids") if CACHE_SHARED else None
+    if known_ids is not None and book_id not in known_ids:
+        return jsonify(success=False), 404
+
     try:
-        response = requests.delete(f"{API_URL}/books/{book_id}")
+        response = CLIENT.delete(f"/books/{book_id}")
         if response.status_code != 200:
             return jsonify(success=False), 400
+        _invalidate_books()
         return jsonify(success=True)
     except Exception as err:
         return jsonify(success=False, error=str(err)), 500
@@ -188,10 +311,12 @@ def update_author(author_id):
         firstname = request.form.get('firstname')
         lastname = request.form.get('lastname')
         photo = request.files.get('photo')
+        if photo and not _allowed(photo.filename):
+            return jsonify(success=False, error="File type not allowed"), 400
 
         if photo:
             filename = secure_filename(photo.filename)
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            photo_path = os.path.join(UPLOAD_DIR, filename)
             photo.save(photo_path)
             photo_url = f'/uploads/{filename}' 
         else:
@@ -203,9 +328,10 @@ def update_author(author_id):
             'photo': photo_url
         }
 
-        response = requests.put(f"{API_URL}/authors/{author_id}", json=data)
+        response = CLIENT.put(f"/authors/{author_id}", content=orjson.dumps(data), headers=JSON_HEADERS)
         if response.status_code != 200:
             return jsonify(success=False, error="Error updating author"), 400
+        _invalidate_authors()
 
         return jsonify(success=True)
     except Exception as err:
@@ -219,8 +345,12 @@ def add_author():
         firstname = request.form.get('firstname')
         lastname = request.form.get('lastname')
         photo = request.files['photo']
+        if photo and not _allowed(photo.filename):
+            return jsonify(success=False, error="File type not allowed"), 400
+
+        # Buffer the photo in the background while the author is being created
+        photo_buffer = EXECUTOR.submit(_buffer_photo, photo.stream) if photo else None
 
-       
         data = {
             'firstname': firstname,
             'lastname': lastname,
@@ -239,52 +369,54 @@ def add_author():
         # - author/<id>
 
         try:
-            response = requests.post(f"{API_URL}/authors/new", json=data)
+            response = CLIENT.post("/authors/new", content=orjson.dumps(data), headers=JSON_HEADERS)
             if response.status_code == 201:
-                resp_data = response.json()
+                _invalidate_authors()
+                resp_data = parse_json(response)
                 id_author = resp_data.get("id", 0)
                 if (id_author == 0):
-                    error_message = response.json().get('error', 'Failed to add author')
+                    error_message = parse_json(response).get('error', 'Failed to add author')
                     app.logger.error(f"Failed to add photo for author: {error_message}")
                     # TODO Delete created author...
                     return jsonify(success=False, error=error_message), 500
                     
-                url_add_photo = f"{API_URL}/author/photo/{id_author}"        
+                url_add_photo = f"/author/photo/{id_author}"        
                 
-                if photo:
-                    filename = secure_filename(photo.filename)
-                    photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    photo.save(photo_path)
-                    
-                    _, file_extension = os.path.splitext(photo_path)
-                    
-                    resp = forward_photo(photo_path, url_add_photo, file_extension)
-                    
+                if photo_buffer:
+                    resp = forward_photo(photo, url_add_photo, photo_buffer.result())
+
                     if resp.status_code != 200:
-                        print("Error:", resp.status_code, resp.text)
-                        error_message = resp.json().get('error', 'Failed to add author')
+                        error_message = parse_json(resp).get('error', 'Failed to add author')
                         app.logger.error(f"Failed to add photo for author: {error_message}, {response.status_code}, {response.text}")
                         # TODO Delete created author...
                         return jsonify(success=False, error=error_message), 500
                 
-                return redirect(url_for("get_authors"))
+                return redirect(_redirect_url('get_authors'))
             else:
-                error_message = response.json().get('error', 'Failed to add author whit status code:' + resp.status_code)
+                error_message = parse_json(response).get('error', 'Failed to add author whit status code:' + resp.status_code)
                 app.logger.error(f"Failed to add author: {error_message}")
                 return jsonify(success=False, error=error_message), 500
         
         except Exception as err:
             app.logger.error(f"Failed to add author: {err}")
             return jsonify(success=False, error=str(err)), 500
+        finally:
+            # Don't leave a pool thread reading request.files after teardown closes them
+            if photo_buffer and not photo_buffer.cancel():
+                photo_buffer.exception()
         
     return render_template('add_author_form.html')
 
-def forward_photo(path, url, extension):
-    with open(path, 'rb') as file:
-        files = {'file': (path, file, f'image/{extension}')}        
-        response = requests.post(url, files=files)
-        
-    return response
+def _buffer_photo(stream):
+    return stream.read()
+
+def forward_photo(photo, url, content=None):
+    # Send the photo as bytes: handing httpx the SpooledTemporaryFile makes it call fileno()
+    # to size the body, which rolls the in-memory upload over to a temp file on disk
+    if content is None:
+        content = _buffer_photo(photo.stream)
+    files = {'file': (secure_filename(photo.filename), content, photo.mimetype)}
+    return CLIENT.post(url, files=files)
 
 @app.route('/add_book', methods=['GET', 'POST'])
 @login_required
@@ -296,6 +428,8 @@ def add_book():
         author_id = request.form.get('author')
         is_borrowed = request.form.get('is_borrowed', 'off') == 'on'
         photo = request.files['photo']
+        if photo and not _allowed(photo.filename):
+            return jsonify(success=False, error="File type not allowed"), 400
 
         data = {
             'title': title,
@@ -306,10 +440,11 @@ def add_book():
         }
 
         try:
-            response = requests.post(f"{API_URL}/books/new", json=data)
+            response = CLIENT.post("/books/new", content=orjson.dumps(data), headers=JSON_HEADERS)
             response.raise_for_status()
+            _invalidate_books()
             
-            resp_data = response.json()
+            resp_data = parse_json(response)
             id_book = resp_data.get("id")
             if not id_book:
                 error_message = "Failed to get book ID from API response"
@@ -317,29 +452,21 @@ def add_book():
                 return render_template('add_book_form.html', authors=authors, error=error_message)
 
             if photo:
-                filename = secure_filename(photo.filename)
-                photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                photo.save(photo_path)
-
-                _, file_extension = os.path.splitext(photo_path)
-                url_add_photo = f"{API_URL}/books/photo/{id_book}"
-                
-                resp = forward_photo(photo_path, url_add_photo, file_extension)
+                url_add_photo = f"/books/photo/{id_book}"
+                resp = forward_photo(photo, url_add_photo)
                 if resp.status_code != 200:
-                    error_message = resp.json().get('error', 'Failed to upload photo')
+                    error_message = parse_json(resp).get('error', 'Failed to upload photo')
                     app.logger.error(f"Failed to upload photo: {error_message}")
                     return render_template('add_book_form.html', authors=authors, error=error_message)
 
-            return redirect(url_for("index"))
+            return redirect(_redirect_url('index'))
 
-        except requests.RequestException as err:
+        except httpx.HTTPError as err:
             app.logger.error(f"Failed to add book: {err}")
             return render_template('add_book_form.html', authors=authors, error=str(err))
     try:
-        response = requests.get(f"{API_URL}/authors")
-        response.raise_for_status()
-        authors = response.json()
-    except requests.RequestException as err:
+        authors = _fetch_authors() or []
+    except httpx.HTTPError as err:
         app.logger.error(f"Failed to fetch authors: {err}")
         authors = []
 
@@ -351,6 +478,9 @@ def upload_book_photo(book_id):
         return jsonify({"error": "No photo provided"}), 400
 
     photo = request.files['photo']
+    if not _allowed(photo.filename):
+        return jsonify({"error": "File type not allowed"}), 400
+
     filename = secure_filename(photo.filename)
     photo_path = os.path.join('/path/to/photos', filename)
     
@@ -376,14 +506,14 @@ def add_subscriber():
             'lastname': lastname,
             'email': email
         }
-        print(data)
+        app.logger.debug("Sending data to API: %s", data)
 
         try:
-            response = requests.post(f"{API_URL}/subscribers/new", json=data)
+            response = CLIENT.post("/subscribers/new", content=orjson.dumps(data), headers=JSON_HEADERS)
             if response.status_code == 200:
-                return redirect(url_for("get_subscribers"))
+                return redirect(_redirect_url('get_subscribers'))
             else:
-                error_message = response.json().get('error', 'Failed to add subscriber')
+                error_message = parse_json(response).get('error', 'Failed to add subscriber')
                 app.logger.error(f"Failed to add subscriber: {error_message}")
                 return jsonify(success=False, error=error_message), 500
 
@@ -398,15 +528,17 @@ def add_subscriber():
 @login_required
 def update_book_form(book_id):
     try:
-        response = requests.get(f"{API_URL}/books/{book_id}")
+        f_book = EXECUTOR.submit(CLIENT.get, f"/books/{book_id}")
+        f_authors = EXECUTOR.submit(_fetch_authors)
+
+        response = f_book.result()
         if response.status_code != 200:
             return "Error fetching book details from API", 400
-        book = response.json()
+        book = parse_json(response)
 
-        response = requests.get(f"{API_URL}/authors")
-        if response.status_code != 200:
+        authors = f_authors.result()
+        if authors is None:
             return "Error fetching authors from API", 400
-        authors = response.json()
 
         return render_template('update_book_form.html', book=book, authors=authors)
     except Exception as err:
@@ -422,10 +554,12 @@ def update_book(book_id):
         author_id = request.form.get('author')
         is_borrowed = request.form.get('is_borrowed', 'off') == 'on'
         photo = request.files['photo']
+        if photo and not _allowed(photo.filename):
+            return jsonify(success=False, error="File type not allowed"), 400
 
         if photo:
             filename = secure_filename(photo.filename)
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            photo_path = os.path.join(UPLOAD_DIR, filename)
             photo.save(photo_path)
             photo_path = f'photos/{filename}'
         else:
@@ -439,22 +573,24 @@ def update_book(book_id):
             'photo': photo_path
         }
 
-        response = requests.put(f"{API_URL}/books/{book_id}", json=data)
+        response = CLIENT.put(f"/books/{book_id}", content=orjson.dumps(data), headers=JSON_HEADERS)
         if response.status_code != 200:
             return jsonify(success=False, error="Error updating book"), 400
+        _invalidate_books()
 
-        return redirect(url_for('book_details', book_id=book_id))
+        return redirect(_book_details_url(book_id))
     except Exception as err:
         return jsonify(success=False, error=str(err)), 500
 
-    
-@app.route('/css/<path:filename>')
-def serve_css(filename):
-    return send_from_directory('static/css', filename)
+# Redirect targets are resolved on first use inside a real request, so any SCRIPT_NAME
+# prefix is kept, and then served from the cache instead of walking the URL map
+@lru_cache(maxsize=None)
+def _redirect_url(endpoint):
+    return url_for(endpoint)
 
-@app.route('/js/<path:filename>')
-def serve_js(filename):
-    return send_from_directory('static/js', filename)
+@lru_cache(maxsize=4096)
+def _book_details_url(book_id):
+    return url_for('book_details', book_id=book_id)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=DEBUG, host='0.0.0.0', port=5000)
@@ -0,0 +1,7 @@
+# Patch sockets/ssl before httpx or flask are imported so blocking API calls yield to other greenlets
+from gevent import monkey
+monkey.patch_all()
+
+from main import app
+
+# gunicorn -k gevent -w 2 --worker-connections 1000 -b 0.0.0.0:5000 wsgi:app